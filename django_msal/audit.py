@@ -0,0 +1,117 @@
+import atexit
+import collections
+import logging
+import threading
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import conf
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseSink:
+    # Default sink. Writes a flushed batch of events to the SignInEvent table with one insert.
+    def write(self, events):
+        from .models import SignInEvent
+        try:
+            SignInEvent.objects.bulk_create([SignInEvent(**event) for event in events])
+        finally:
+            # The flush thread outlives requests, so do not hold on to a connection between flushes
+            if not connection.in_atomic_block:
+                connection.close()
+
+
+class LoggingSink:
+    # Writes each event to the django_msal.audit logger. Useful when events are shipped from logs.
+    def write(self, events):
+        for event in events:
+            logger.info('Sign-in event', extra={'audit_event': event})
+
+
+class AuditBuffer:
+    # Events are appended in the request thread and written to the sink by a background thread,
+    # so a sign-in never waits on the audit write. The buffer is bounded: when it is full,
+    # new events are dropped and counted rather than growing memory or blocking.
+
+    def __init__(self, sink, max_size=10000, batch_size=500, flush_interval=5.0):
+        self.sink = sink
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {'emitted': 0, 'dropped': 0, 'written': 0, 'failed': 0}
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def emit(self, event):
+        with self._lock:
+            if len(self._events) >= self.max_size:
+                self.stats['dropped'] += 1
+                return
+            self._events.append(event)
+            self.stats['emitted'] += 1
+            if self._thread is None:
+                self._start()
+            if len(self._events) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self):
+        while True:
+            with self._lock:
+                batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            if not batch:
+                return
+            try:
+                self.sink.write(batch)
+                outcome = 'written'
+            except Exception:
+                outcome = 'failed'
+                logger.exception('Unable to write %s sign-in audit events' % len(batch))
+            with self._lock:
+                self.stats[outcome] += len(batch)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='django_msal-audit', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AuditBuffer(
+                    import_string(conf.DJANGO_MSAL_AUDIT_SINK)(),
+                    max_size=conf.DJANGO_MSAL_AUDIT_BUFFER_SIZE,
+                    batch_size=conf.DJANGO_MSAL_AUDIT_BATCH_SIZE,
+                    flush_interval=conf.DJANGO_MSAL_AUDIT_FLUSH_INTERVAL,
+                )
+    return _buffer
+
+
+def emit(outcome, reason='', oid=None, tid=None, latency_ms=None):
+    if not conf.DJANGO_MSAL_AUDIT_ENABLED:
+        return
+    get_buffer().emit({
+        'created': timezone.now(),
+        'oid': oid,
+        'tid': tid,
+        'outcome': outcome,
+        'reason': (reason or '')[:100],
+        'latency_ms': latency_ms,
+    })
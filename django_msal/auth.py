@@ -11,6 +11,7 @@ from django.core.validators import validate_email
 from django.template.loader import render_to_string
 
 from .models import MicrosoftUser, MicrosoftTenant
+from .sessions import forget_session, record_session
 from . import conf
 
 User = get_user_model()
@@ -35,9 +36,18 @@ class MSALAuthBackend(ModelBackend):
             return None
 
 
-    def login(self, request, user):
+    def login(self, request, user, token_claims=None):
         # We have a user that has been authorized by an Microsoft Tenant. Log them in
+        # Logging in cycles the session key, so the entry for the old key is removed
+        previous_session_key = request.session.session_key
         auth_login(request, user, backend='django_msal.auth.MSALAuthBackend')
+        if previous_session_key != request.session.session_key:
+            forget_session(previous_session_key)
+        # Index the session by oid and sid so it can be revoked on logout from elsewhere
+        token_claims = token_claims or {}
+        oid = token_claims.get('oid') or user.microsoftuser.oid
+        if oid:
+            record_session(request, oid, token_claims.get('sid'))
 
 
     def validate_request(self, request):
@@ -45,6 +45,7 @@ DJANGO_MSAL_LOGIN_PATH = getattr(settings, 'DJANGO_MSAL_LOGIN_PATH', 'login/')
 DJANGO_MSAL_LANDING_PATH = getattr(settings, 'DJANGO_MSAL_LANDING_PATH', 'landing/')
 DJANGO_MSAL_LOGOUT_PATH = getattr(settings, 'DJANGO_MSAL_LOGOUT_PATH', 'logout/')
 DJANGO_MSAL_REDIRECT_PATH = getattr(settings, 'DJANGO_MSAL_REDIRECT_PATH','authorize/')
+DJANGO_MSAL_FRONTCHANNEL_LOGOUT_PATH = getattr(settings, 'DJANGO_MSAL_FRONTCHANNEL_LOGOUT_PATH', 'logout/frontchannel/')
 
 # Change this if you choose to change the Django admin url
 DJANGO_MSAL_ADMIN_PATH = getattr(settings, 'DJANGO_MSAL_ADMIN_PATH','admin/')
@@ -58,6 +59,9 @@ DJANGO_MSAL_ABSOLUTE_REDIRECT_PATH = '%s/%s' % (DJANGO_MSAL_REDIRECT_DOMAIN, DJA
 # Must match the Logout URL set in the Azure portal
 DJANGO_MSAL_ABSOLUTE_LOGOUT_PATH = '%s/%s' % (DJANGO_MSAL_REDIRECT_DOMAIN, DJANGO_MSAL_LOGOUT_PATH)
 
+# Set as the Front-channel logout URL in the Azure portal to end sessions when a user signs out of their MS account
+DJANGO_MSAL_ABSOLUTE_FRONTCHANNEL_LOGOUT_PATH = '%s/%s' % (DJANGO_MSAL_REDIRECT_DOMAIN, DJANGO_MSAL_FRONTCHANNEL_LOGOUT_PATH)
+
 # You can find more Microsoft Graph API endpoints from Graph Explorer
 # https://developer.microsoft.com/en-us/graph/graph-explorer
 DJANGO_MSAL_ENDPOINT = 'https://graph.microsoft.com/v1.0/users'  # This resource requires no admin consent
@@ -101,6 +105,30 @@ if DJANGO_MSAL_SEND_NEW_ACCOUNT_EMAILS:
     except AttributeError:
         raise ImproperlyConfigured('DJANGO_MSAL_ADMINS or ADMINS is a required setting')
 
+# Records are created this many at a time by the provision_ms_users command and the provisioning endpoint
+DJANGO_MSAL_PROVISIONING_BATCH_SIZE = getattr(settings, 'DJANGO_MSAL_PROVISIONING_BATCH_SIZE', 500)
+
+# If DJANGO_MSAL_PROVISIONING_TOKEN is set:
+#       users can be provisioned in bulk by posting CSV or JSONL to DJANGO_MSAL_PROVISIONING_PATH
+#       with the header "Authorization: Bearer <token>"
+# If DJANGO_MSAL_PROVISIONING_TOKEN is not set, the provisioning endpoint is disabled
+DJANGO_MSAL_PROVISIONING_TOKEN = getattr(settings, 'DJANGO_MSAL_PROVISIONING_TOKEN', None)
+DJANGO_MSAL_PROVISIONING_PATH = getattr(settings, 'DJANGO_MSAL_PROVISIONING_PATH', 'provision/')
+
+# If DJANGO_MSAL_AUDIT_ENABLED is True:
+#       every Microsoft sign-in attempt is recorded as a SignInEvent with its outcome and failure reason.
+#       Events are buffered in memory and written in batches by a background thread.
+#       At most DJANGO_MSAL_AUDIT_BUFFER_SIZE events are buffered; further events are dropped and counted.
+DJANGO_MSAL_AUDIT_ENABLED = getattr(settings, 'DJANGO_MSAL_AUDIT_ENABLED', True)
+DJANGO_MSAL_AUDIT_BUFFER_SIZE = getattr(settings, 'DJANGO_MSAL_AUDIT_BUFFER_SIZE', 10000)
+DJANGO_MSAL_AUDIT_BATCH_SIZE = getattr(settings, 'DJANGO_MSAL_AUDIT_BATCH_SIZE', 500)
+# Seconds between flushes when fewer than DJANGO_MSAL_AUDIT_BATCH_SIZE events are waiting
+DJANGO_MSAL_AUDIT_FLUSH_INTERVAL = getattr(settings, 'DJANGO_MSAL_AUDIT_FLUSH_INTERVAL', 5)
+# Dotted path to a class with a write(events) method. django_msal.audit.LoggingSink is also available
+DJANGO_MSAL_AUDIT_SINK = getattr(settings, 'DJANGO_MSAL_AUDIT_SINK', 'django_msal.audit.DatabaseSink')
+# Sign-in events older than this many days are deleted by the prune_ms_sign_in_events command
+DJANGO_MSAL_AUDIT_RETENTION_DAYS = getattr(settings, 'DJANGO_MSAL_AUDIT_RETENTION_DAYS', 90)
+
 # In your Django settings, make sure to set LOGIN_URL to the align with DJANGO_MSAL_LOGIN_PATH
 # If going with defaults, this should go in settings.py: LOGIN_URL = '/login/'
 
@@ -0,0 +1,108 @@
+import logging
+import threading
+
+import msal
+import requests
+
+from django.db import connection, transaction
+
+from .models import MicrosoftTenant
+from . import conf
+
+logger = logging.getLogger(__name__)
+
+
+def get_primary_tenant():
+    # Make sure our primary tenant exists
+    try:
+        return MicrosoftTenant.objects.get(tid=conf.DJANGO_MSAL_PRIMARY_TENANT_ID)
+    except MicrosoftTenant.DoesNotExist:
+        return MicrosoftTenant.objects.create(
+            tid=conf.DJANGO_MSAL_PRIMARY_TENANT_ID,
+            name=conf.DJANGO_MSAL_PRIMARY_TENANT_NAME
+        )
+
+
+def acquire_app_token(tenant):
+    authority = 'https://login.microsoftonline.com/%s' % (tenant.tid)
+    msal_app = msal.ConfidentialClientApplication(
+        conf.DJANGO_MSAL_CLIENT_ID,
+        authority=authority,
+        client_credential=conf.DJANGO_MSAL_CLIENT_SECRET)
+
+    scope = "https://graph.microsoft.com/.default"
+    token_result = msal_app.acquire_token_for_client(scopes=scope)
+    if not 'access_token' in token_result:
+        raise Exception('Unable to get MSAL app token')
+    return token_result['access_token']
+
+
+def link_microsoft_user(microsoftuser, tenant, access_token):
+    # Look the user up in Microsoft Graph by email and store their MS account details.
+    # Returns a message describing the outcome.
+    user = microsoftuser.user
+    email = user.email
+    if not email:
+        return 'User %s does not have an email address and therefore cannot be linked to an MS account' % (user.username)
+
+    select = '%s?$select=displayName,userPrincipalName,mail,id' % (email)
+    query = '%s/%s' % (conf.DJANGO_MSAL_GRAPH_ENDPOINT, select)
+    result = requests.get(
+        query,
+        headers={'Authorization': 'Bearer ' + access_token},
+    ).json()
+    if 'error' in result:
+        return 'Email: %s - Error: %s' % (email, result['error']['message'][:50])
+
+    try:
+        with transaction.atomic():
+            microsoftuser.oid = result['id']
+            microsoftuser.preferred_username = result['userPrincipalName']
+            microsoftuser.name = result['displayName']
+            microsoftuser.tenant = tenant
+            microsoftuser.save()
+            user.set_unusable_password()
+            user.save(update_fields=["password"])
+            return 'Email: %s - Saved new microsoft user and made password unusable' % (email)
+    except Exception as e:
+        return 'Email: %s - Error: %s' % (email, e)
+
+
+def link_microsoft_users(microsoftusers, report=logger.info, chunk_size=500):
+    # Walk the selection in primary key order, a chunk at a time, so that a very large
+    # selection neither loads every row nor builds one huge IN (...) query.
+    # Returns the number of users processed.
+    tenant = get_primary_tenant()
+    access_token = acquire_app_token(tenant)
+    microsoftusers = microsoftusers.select_related('user').order_by('pk')
+    processed = 0
+    last_pk = None
+    while True:
+        chunk = microsoftusers if last_pk is None else microsoftusers.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return processed
+        for microsoftuser in chunk:
+            report(link_microsoft_user(microsoftuser, tenant, access_token))
+        processed += len(chunk)
+        last_pk = chunk[-1].pk
+
+
+def link_microsoft_users_in_background(microsoftusers):
+    # Used by admin actions so that a large selection does not hold up the request.
+    # The thread gets its own database connection, which is closed when it is done.
+    # The thread is not tracked: if the process restarts, the run is lost, so the log
+    # records when each run starts and finishes.
+    def run():
+        logger.info('Started linking Microsoft users via Microsoft Graph in the background')
+        try:
+            processed = link_microsoft_users(microsoftusers)
+            logger.info('Finished linking %s Microsoft users via Microsoft Graph in the background' % processed)
+        except Exception:
+            logger.exception('Linking Microsoft users in the background failed')
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name='django_msal-link', daemon=True)
+    thread.start()
+    return thread
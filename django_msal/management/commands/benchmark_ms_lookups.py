@@ -0,0 +1,106 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django_msal.models import MicrosoftUser, MicrosoftTenant
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Time the MicrosoftUser lookups served by the django_msal indexes against a large generated table, '
+            'with and without those indexes. Lookups by oid or tid use the unique indexes, which are not '
+            'dropped, so they are not timed. All generated data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Number of users to generate')
+        parser.add_argument('--tenants', type=int, default=100, help='Number of tenants to generate')
+        parser.add_argument('--repeat', type=int, default=100, help='Number of times each lookup is run')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--i-know-this-locks-tables', action='store_true',
+                            help='Run even though the user tables already have rows. The benchmark holds '
+                                 'locks on them until it finishes, which blocks sign-ins on a live database')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['tenants'] < 1:
+            raise CommandError('--rows and --tenants must be at least 1')
+        if MicrosoftUser.objects.exists() and not options['i_know_this_locks_tables']:
+            raise CommandError(
+                'The MicrosoftUser table is not empty. The benchmark inserts into the user tables and drops '
+                'indexes inside one transaction, which locks them until it finishes and blocks sign-ins. '
+                'Run it against a scratch database, or pass --i-know-this-locks-tables.')
+        with transaction.atomic():
+            sample = self._generate(options['rows'], options['tenants'], options['batch_size'])
+            self.stdout.write('With indexes (ms per lookup):')
+            self._run_lookups(sample, options['repeat'])
+
+            if connection.features.can_rollback_ddl:
+                self._remove_indexes()
+                self.stdout.write('Without indexes (ms per lookup):')
+                self._run_lookups(sample, options['repeat'])
+            else:
+                self.stdout.write('This database cannot roll back schema changes, skipping the run without indexes')
+
+            transaction.set_rollback(True)
+
+    def _generate(self, rows, tenants, batch_size):
+        self.stdout.write('Generating %s tenants and %s users...' % (tenants, rows))
+        MicrosoftTenant.objects.bulk_create([
+            MicrosoftTenant(tid=str(uuid.uuid4()), name='bench-%s' % i, is_active=bool(i % 2))
+            for i in range(tenants)
+        ])
+        tenant_objs = list(MicrosoftTenant.objects.filter(name__startswith='bench-'))
+
+        for start in range(0, rows, batch_size):
+            usernames = ['bench-%s' % i for i in range(start, min(start + batch_size, rows))]
+            # The post_save signal does not fire for bulk_create, so MicrosoftUsers are created explicitly
+            User.objects.bulk_create([User(username=username, password='!') for username in usernames])
+            users = User.objects.filter(username__in=usernames).only('pk', 'username')
+            microsoftusers = []
+            for i, user in enumerate(users):
+                # Leave one user in ten unlinked, like a partially linked install
+                linked = (start + i) % 10
+                microsoftusers.append(MicrosoftUser(
+                    user=user,
+                    oid=str(uuid.uuid4()) if linked else None,
+                    tenant=tenant_objs[(start + i) % len(tenant_objs)],
+                    preferred_username='%s@example.com' % user.username,
+                    name=user.username,
+                ))
+            MicrosoftUser.objects.bulk_create(microsoftusers)
+            # Look up a user from the last batch so that a scan has to read the whole table
+            last_user = microsoftusers[-1]
+            sample = {
+                'preferred_username': last_user.preferred_username.upper(),
+                'name': last_user.name.upper(),
+            }
+        # Make sure the query planner knows how big the tables are now
+        analyze = 'ANALYZE TABLE %s' if connection.vendor == 'mysql' else 'ANALYZE %s'
+        with connection.cursor() as cursor:
+            for model in (User, MicrosoftUser, MicrosoftTenant):
+                cursor.execute(analyze % connection.ops.quote_name(model._meta.db_table))
+        return sample
+
+    def _remove_indexes(self):
+        # Drop the indexes with plain DROP INDEX statements inside the open transaction.
+        # The schema editor itself cannot be entered here on SQLite.
+        schema_editor = connection.SchemaEditorClass(connection)
+        with connection.cursor() as cursor:
+            for index in MicrosoftUser._meta.indexes:
+                cursor.execute(str(index.remove_sql(MicrosoftUser, schema_editor)))
+
+    def _run_lookups(self, sample, repeat):
+        lookups = [
+            ('unlinked users (first 100)', lambda: list(MicrosoftUser.objects.filter(oid=None)[:100])),
+            ('preferred_username iexact', lambda: list(MicrosoftUser.objects.filter(
+                preferred_username__iexact=sample['preferred_username']))),
+            ('name iexact', lambda: list(MicrosoftUser.objects.filter(name__iexact=sample['name']))),
+        ]
+        for label, lookup in lookups:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                lookup()
+            elapsed = (time.perf_counter() - start) * 1000 / repeat
+            self.stdout.write('  %-30s %10.3f' % (label, elapsed))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from django_msal.sessions import prune_sessions
+
+
+class Command(BaseCommand):
+    help = ('Remove session index entries whose session has expired or been deleted. '
+            'Companion to clearsessions; run it on the same schedule')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Removed %s expired session index entries' % prune_sessions())
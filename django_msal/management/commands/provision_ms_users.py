@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django_msal.graph import acquire_app_token, get_primary_tenant
+from django_msal.models import MicrosoftTenant
+from django_msal.provisioning import ProvisioningError, graph_records, provision_users, read_records
+from django_msal import conf
+
+
+class Command(BaseCommand):
+    help = ('Create Users and MicrosoftUsers in bulk from a CSV or JSONL directory export, '
+            'or from the Microsoft Graph users listing of the primary tenant')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            help='CSV or JSONL export to read. Use - to read from stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Format of the export. Defaults to the file extension')
+        parser.add_argument('--graph', action='store_true',
+                            help='Read users from Microsoft Graph instead of an export')
+        parser.add_argument('--tenant',
+                            help='Tenant ID for records without a tid. Defaults to the primary tenant')
+        parser.add_argument('--batch-size', type=int, default=conf.DJANGO_MSAL_PROVISIONING_BATCH_SIZE)
+        parser.add_argument('--no-emails', action='store_true',
+                            help='Do not send new account emails')
+
+    def handle(self, *args, **options):
+        if bool(options['path']) == options['graph']:
+            raise CommandError('Give either an export path or --graph')
+
+        if options['tenant']:
+            try:
+                tenant = MicrosoftTenant.objects.get(tid=options['tenant'])
+            except MicrosoftTenant.DoesNotExist:
+                raise CommandError('Tenant %s does not exist' % options['tenant'])
+        else:
+            tenant = get_primary_tenant()
+
+        send_emails = False if options['no_emails'] else None
+
+        try:
+            totals = self._provision(options, tenant, send_emails)
+        except ProvisioningError as e:
+            raise CommandError('%s (created %s users, skipped %s, %s invalid before the error)' % (
+                e, e.totals['created'], e.totals['skipped'], e.totals['invalid']))
+
+        self.stdout.write('Created %(created)s users, skipped %(skipped)s, %(invalid)s invalid' % totals)
+
+    def _provision(self, options, tenant, send_emails):
+        if options['graph']:
+            records = graph_records(acquire_app_token(tenant))
+            return provision_users(records, tenant, options['batch_size'], send_emails)
+
+        path = options['path']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            return provision_users(read_records(sys.stdin, format), tenant, options['batch_size'], send_emails)
+        with open(path, newline='', encoding='utf-8') as f:
+            return provision_users(read_records(f, format), tenant, options['batch_size'], send_emails)
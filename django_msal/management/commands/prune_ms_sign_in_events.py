@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django_msal.models import SignInEvent
+from django_msal import conf
+
+
+class Command(BaseCommand):
+    help = 'Delete sign-in audit events older than the retention period. Run it regularly, e.g. daily from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=conf.DJANGO_MSAL_AUDIT_RETENTION_DAYS,
+                            help='Keep events from this many days. Defaults to DJANGO_MSAL_AUDIT_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        # Delete in batches so that a large backlog does not become one long-running delete
+        old_events = SignInEvent.objects.filter(created__lt=cutoff)
+        deleted = 0
+        while True:
+            pks = list(old_events.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            deleted += SignInEvent.objects.filter(pk__in=pks).delete()[0]
+        self.stdout.write('Deleted %s sign-in events older than %s' % (deleted, cutoff))
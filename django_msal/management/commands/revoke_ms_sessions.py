@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django_msal.sessions import revoke_sessions
+
+
+class Command(BaseCommand):
+    help = 'Sign Microsoft users out of all of their Django sessions, for example after they are disabled in Azure AD'
+
+    def add_arguments(self, parser):
+        parser.add_argument('oids', nargs='+', help='Object IDs of the users to sign out')
+
+    def handle(self, *args, **options):
+        for oid in options['oids']:
+            revoked = revoke_sessions(oid=oid)
+            self.stdout.write('Object ID: %s - Revoked %s sessions' % (oid, revoked))
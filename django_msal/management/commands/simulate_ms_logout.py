@@ -0,0 +1,25 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import reverse
+from django_msal import views
+
+
+class Command(BaseCommand):
+    help = ('Simulate the front-channel logout notification Microsoft sends when a user signs out, '
+            'without needing an Azure AD sign-out. Useful for testing session revocation locally.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sid', help='The sid claim of the sign-in session to log out')
+
+    def handle(self, *args, **options):
+        # Build the request the same way Microsoft's hidden iframe would send it: a GET with the sid,
+        # from a browser that does not send our session cookie
+        request = RequestFactory().get(reverse('frontchannel_logout'), {'sid': options['sid']})
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.user = AnonymousUser()
+        response = views.frontchannel_logout(request)
+        self.stdout.write('Front-channel logout for sid %s returned %s' % (options['sid'], response.status_code))
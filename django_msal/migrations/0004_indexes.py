@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:15
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+CASE_INSENSITIVE_FIELDS = (
+    ('preferred_username', 'msaluser_upper_upn_idx'),
+    ('name', 'msaluser_upper_name_idx'),
+)
+
+
+def _case_insensitive_indexes(schema_editor):
+    # MySQL compiles iexact to LIKE and relies on its case-insensitive collations, so an
+    # UPPER() expression index would never be used there. Use a plain index on MySQL instead.
+    for field_name, index_name in CASE_INSENSITIVE_FIELDS:
+        if schema_editor.connection.vendor == 'mysql':
+            yield models.Index(fields=[field_name], name=index_name)
+        else:
+            yield models.Index(django.db.models.functions.text.Upper(field_name), name=index_name)
+
+
+def add_case_insensitive_indexes(apps, schema_editor):
+    MicrosoftUser = apps.get_model('django_msal', 'MicrosoftUser')
+    for index in _case_insensitive_indexes(schema_editor):
+        schema_editor.add_index(MicrosoftUser, index)
+
+
+def remove_case_insensitive_indexes(apps, schema_editor):
+    MicrosoftUser = apps.get_model('django_msal', 'MicrosoftUser')
+    for index in _case_insensitive_indexes(schema_editor):
+        schema_editor.remove_index(MicrosoftUser, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_msal', '0003_link_ms_accounts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='microsoftuser',
+            index=models.Index(condition=models.Q(('oid__isnull', True)), fields=['user'], name='msaluser_unlinked_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='microsoftuser',
+                    index=models.Index(django.db.models.functions.text.Upper('preferred_username'), name='msaluser_upper_upn_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='microsoftuser',
+                    index=models.Index(django.db.models.functions.text.Upper('name'), name='msaluser_upper_name_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_case_insensitive_indexes, remove_case_insensitive_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_msal', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignInEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('oid', models.CharField(blank=True, db_index=True, max_length=40, null=True, verbose_name='Object ID')),
+                ('tid', models.CharField(blank=True, max_length=40, null=True, verbose_name='Tenant ID')),
+                ('outcome', models.CharField(choices=[('success', 'Success'), ('failure', 'Failure')], max_length=10)),
+                ('reason', models.CharField(blank=True, max_length=100)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Latency (ms)')),
+            ],
+        ),
+    ]
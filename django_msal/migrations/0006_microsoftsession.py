@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_msal', '0005_signinevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MicrosoftSession',
+            fields=[
+                ('session_key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('oid', models.CharField(db_index=True, max_length=40, verbose_name='Object ID')),
+                ('sid', models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Session ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
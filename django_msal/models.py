@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
 from django.db import models
+from django.db.models.functions import Upper
 from django.dispatch import receiver
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -11,6 +14,16 @@ class MicrosoftUser(models.Model):
     preferred_username = models.CharField("Preferred Username", max_length=254, blank=True, null=True)
     name = models.CharField("Name", max_length=40, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # link_ms_accounts and the admin "not linked" filter look for users without an oid
+            models.Index(fields=['user'], name='msaluser_unlinked_idx', condition=models.Q(oid__isnull=True)),
+            # Admin search matches preferred_username and name case-insensitively.
+            # Migration 0004 creates these as plain indexes on MySQL, where iexact uses LIKE.
+            models.Index(Upper('preferred_username'), name='msaluser_upper_upn_idx'),
+            models.Index(Upper('name'), name='msaluser_upper_name_idx'),
+        ]
+
     def __str__(self):
         if self.name:
             return self.name
@@ -30,3 +43,41 @@ class MicrosoftTenant(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class SignInEvent(models.Model):
+    SUCCESS = 'success'
+    FAILURE = 'failure'
+    OUTCOME_CHOICES = (
+        (SUCCESS, 'Success'),
+        (FAILURE, 'Failure'),
+    )
+
+    created = models.DateTimeField(default=timezone.now)
+    oid = models.CharField("Object ID", max_length=40, blank=True, null=True, db_index=True)
+    tid = models.CharField("Tenant ID", max_length=40, blank=True, null=True)
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    reason = models.CharField(max_length=100, blank=True)
+    latency_ms = models.PositiveIntegerField("Latency (ms)", blank=True, null=True)
+
+    def __str__(self):
+        return '%s %s %s' % (self.created, self.oid or '-', self.outcome)
+
+
+class MicrosoftSession(models.Model):
+    # Index of the Django sessions created by Microsoft sign-ins, so that all sessions of a user
+    # can be found by oid (or by the sign-in session id, sid) without scanning the session table
+    session_key = models.CharField(max_length=40, primary_key=True)
+    oid = models.CharField("Object ID", max_length=40, db_index=True)
+    sid = models.CharField("Session ID", max_length=64, blank=True, null=True, db_index=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '%s - %s' % (self.oid, self.session_key)
+
+
+@receiver(user_logged_out)
+def forget_microsoft_session(sender, request, user, **kwargs):
+    # Covers every logout (our views, the admin, any other auth_logout caller), not just ours
+    if request is not None and request.session.session_key:
+        MicrosoftSession.objects.filter(session_key=request.session.session_key).delete()
@@ -0,0 +1,237 @@
+import csv
+import itertools
+import json
+import logging
+
+import requests
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from .models import MicrosoftUser, MicrosoftTenant
+from . import conf
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Keys we accept for each MicrosoftUser field, in order of preference.
+# Covers our own CSV/JSONL columns, Microsoft Graph user objects and SCIM core user attributes.
+RECORD_KEYS = {
+    'oid': ('oid', 'id', 'externalId'),
+    'tid': ('tid',),
+    'preferred_username': ('preferred_username', 'userPrincipalName', 'userName'),
+    'name': ('name', 'displayName'),
+    'email': ('email', 'mail'),
+}
+
+
+class ProvisioningError(Exception):
+    # Raised when a feed cannot be provisioned to the end. Batches before the error have already
+    # been saved, so the totals so far are kept on the exception.
+    def __init__(self, message, totals):
+        super().__init__(message)
+        self.totals = totals
+
+
+def normalize_record(record):
+    normalized = {}
+    for field, keys in RECORD_KEYS.items():
+        normalized[field] = next((record[key] for key in keys if record.get(key)), None)
+    # SCIM sends emails as a list of {"value": ..., "primary": ...}
+    emails = record.get('emails')
+    if not normalized['email'] and isinstance(emails, list):
+        emails = sorted((e for e in emails if isinstance(e, dict)), key=lambda e: not e.get('primary'))
+        if emails:
+            normalized['email'] = emails[0].get('value')
+    return normalized
+
+
+def read_records(lines, format='jsonl'):
+    # lines is any iterable of text lines (an open file, stdin, a request body) so that
+    # records are read one at a time and large exports are never held in memory.
+    # A JSONL line that is not a JSON object is passed on as None and counted as invalid.
+    if format == 'csv':
+        for record in csv.DictReader(lines):
+            yield record
+    elif format == 'jsonl':
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else None
+    else:
+        raise ValueError('Unknown record format: %s' % format)
+
+
+def graph_records(access_token, page_size=999):
+    # Page through the Microsoft Graph users listing, following @odata.nextLink
+    query = '%s?$select=id,displayName,userPrincipalName,mail&$top=%s' % (conf.DJANGO_MSAL_GRAPH_ENDPOINT, page_size)
+    while query:
+        result = requests.get(
+            query,
+            headers={'Authorization': 'Bearer ' + access_token},
+        ).json()
+        if 'error' in result:
+            raise Exception('Microsoft Graph error: %s' % result['error']['message'])
+        for record in result.get('value', []):
+            yield record
+        query = result.get('@odata.nextLink')
+
+
+def provision_users(records, tenant=None, batch_size=500, send_emails=None):
+    # Create Users and MicrosoftUsers for records that are not already linked.
+    # Records are processed in batches so that memory stays constant for large exports.
+    # Returns a dict counting records that were created, skipped because they are already
+    # provisioned, and invalid (not an object, no oid or username, or an unknown tenant).
+    # Failures to send new account emails are logged and do not stop provisioning.
+    if send_emails is None:
+        send_emails = conf.DJANGO_MSAL_SEND_NEW_ACCOUNT_EMAILS
+    totals = {'created': 0, 'skipped': 0, 'invalid': 0}
+    records = iter(records)
+    while True:
+        try:
+            batch = list(itertools.islice(records, batch_size))
+        except (ValueError, csv.Error) as e:
+            raise ProvisioningError('Unable to read provisioning data: %s' % e, totals) from e
+        if not batch:
+            break
+        try:
+            created, skipped, invalid = _provision_batch(batch, tenant)
+        except IntegrityError as e:
+            # Someone signed in for the first time with one of these usernames or oids while the batch
+            # was being created. The batch is rolled back; running the feed again will skip saved records.
+            raise ProvisioningError('Unable to save a batch of users, it was rolled back: %s' % e, totals) from e
+        totals['created'] += len(created)
+        totals['skipped'] += skipped
+        totals['invalid'] += invalid
+        logger.info('Provisioned %s Microsoft users, skipped %s, %s invalid' % (len(created), skipped, invalid))
+        if send_emails and created:
+            try:
+                _send_new_account_emails(created)
+            except Exception:
+                # The users are saved and a re-run would skip them, so carry on rather than stop the feed
+                logger.exception('Unable to send new account emails for %s' % ', '.join(
+                    m.preferred_username for m in created))
+    return totals
+
+
+def _provision_batch(batch, default_tenant):
+    records = [normalize_record(r) for r in batch if isinstance(r, dict)]
+    records = [r for r in records if r['oid'] and r['preferred_username']]
+    # Provisioning never adds tenants. A new tenant has to be allowed before its users can sign in,
+    # so records for a tenant that is not in the MicrosoftTenant table are rejected.
+    tenants = _get_tenants(records)
+    records = [r for r in records if not r['tid'] or r['tid'] in tenants]
+    invalid = len(batch) - len(records)
+
+    valid = {}
+    for record in records:
+        valid.setdefault(record['oid'], record)
+    existing = set(MicrosoftUser.objects.filter(oid__in=valid).values_list('oid', flat=True))
+    new_records = [r for oid, r in valid.items() if oid not in existing]
+    skipped = len(records) - len(new_records)
+    if not new_records:
+        return [], skipped, invalid
+
+    with transaction.atomic():
+        usernames = _allocate_usernames([r['preferred_username'] for r in new_records])
+        users = []
+        for record, username in zip(new_records, usernames):
+            email = record['email'] or record['preferred_username']
+            try:
+                validate_email(email)
+            except ValidationError:
+                email = ''
+            # We will not be using this password, but the Django User model requires it
+            users.append(User(username=username, email=email, password=make_password(None)))
+        # bulk_create does not send post_save, so the MicrosoftUsers are created here as well.
+        # Not every database returns primary keys from bulk_create, so the users are read back.
+        User.objects.bulk_create(users)
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        microsoftusers = [
+            MicrosoftUser(
+                user_id=user_ids[username],
+                oid=record['oid'],
+                tenant=tenants.get(record['tid'], default_tenant),
+                preferred_username=record['preferred_username'],
+                name=(record['name'] or '')[:MicrosoftUser._meta.get_field('name').max_length] or None,
+            )
+            for record, username in zip(new_records, usernames)
+        ]
+        MicrosoftUser.objects.bulk_create(microsoftusers)
+    return microsoftusers, skipped, invalid
+
+
+def _get_tenants(records):
+    tids = {r['tid'] for r in records if r['tid']}
+    return {t.tid: t for t in MicrosoftTenant.objects.filter(tid__in=tids)}
+
+
+def _allocate_usernames(preferred_usernames):
+    # The preferred_username from Microsoft is not guaranteed to be unique.
+    # Allocate unique usernames for the whole batch with two queries rather than one per user.
+    wanted = set(preferred_usernames)
+    taken = set(User.objects.filter(username__in=wanted).values_list('username', flat=True))
+    if taken:
+        conflicts = Q()
+        for username in taken:
+            conflicts |= Q(username__startswith='%s_' % username)
+        taken.update(User.objects.filter(conflicts).values_list('username', flat=True))
+
+    usernames = []
+    for preferred_username in preferred_usernames:
+        username = preferred_username
+        username_suffix = 1
+        while username in taken:
+            username = '%s_%s' % (preferred_username, username_suffix)
+            username_suffix += 1
+        taken.add(username)
+        usernames.append(username)
+    return usernames
+
+
+def _send_new_account_emails(microsoftusers):
+    # One connection and one admin email per batch instead of per user
+    from_email = conf.DJANGO_MSAL_FROM_EMAIL
+    admin_emails = [a[1] for a in conf.DJANGO_MSAL_ADMINS]
+    users = User.objects.in_bulk([m.user_id for m in microsoftusers])
+    messages = []
+
+    subject = '%s - New Accounts Created' % (conf.DJANGO_MSAL_APP_NAME)
+    message = render_to_string('django_msal/new_accounts_created_email.html', {
+        'microsoftusers': microsoftusers,
+        'app_name': conf.DJANGO_MSAL_APP_NAME
+    })
+    if admin_emails:
+        messages.append(_html_email(subject, message, from_email, admin_emails))
+
+    subject = 'Welcome to %s' % (conf.DJANGO_MSAL_APP_NAME)
+    for microsoftuser in microsoftusers:
+        user_email = users[microsoftuser.user_id].email
+        if user_email:
+            message = render_to_string('django_msal/new_user_welcome_email.html', {
+                'name': microsoftuser.name,
+                'preferred_username': microsoftuser.preferred_username,
+                'app_name': conf.DJANGO_MSAL_APP_NAME
+            })
+            messages.append(_html_email(subject, message, from_email, [user_email]))
+
+    get_connection(fail_silently=False).send_messages(messages)
+    logger.info('Sent %s new account emails' % len(messages))
+
+
+def _html_email(subject, html_message, from_email, recipient_list):
+    email = EmailMultiAlternatives(subject, '', from_email, recipient_list)
+    email.attach_alternative(html_message, 'text/html')
+    return email
@@ -0,0 +1,76 @@
+import logging
+from importlib import import_module
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import MicrosoftSession
+
+logger = logging.getLogger(__name__)
+
+
+def _session_store():
+    return import_module(settings.SESSION_ENGINE).SessionStore
+
+
+def record_session(request, oid, sid=None):
+    # Called after login so that the session can later be revoked by oid or sid
+    if not request.session.session_key:
+        request.session.save()
+    MicrosoftSession.objects.update_or_create(
+        session_key=request.session.session_key,
+        defaults={'oid': oid, 'sid': sid},
+    )
+
+
+def forget_session(session_key):
+    if session_key:
+        MicrosoftSession.objects.filter(session_key=session_key).delete()
+
+
+def prune_sessions(batch_size=1000):
+    # Entries for sessions that simply expire are never removed by a logout, so drop the ones whose
+    # session no longer exists. A session is kept alive by being saved again, so its age alone says
+    # nothing. Returns the number of entries removed.
+    SessionStore = _session_store()
+    removed = 0
+    last_key = ''
+    while True:
+        session_keys = list(MicrosoftSession.objects.filter(session_key__gt=last_key).order_by(
+            'session_key').values_list('session_key', flat=True)[:batch_size])
+        if not session_keys:
+            return removed
+        last_key = session_keys[-1]
+        gone = set(session_keys) - _live_session_keys(SessionStore, session_keys)
+        if gone:
+            removed += MicrosoftSession.objects.filter(session_key__in=gone).delete()[0]
+
+
+def _live_session_keys(SessionStore, session_keys):
+    # The database backed engines can check a whole batch with one query, the others one key at a time
+    if hasattr(SessionStore, 'get_model_class'):
+        return set(SessionStore.get_model_class().objects.filter(
+            session_key__in=session_keys, expire_date__gt=timezone.now(),
+        ).values_list('session_key', flat=True))
+    return {session_key for session_key in session_keys if SessionStore().exists(session_key)}
+
+
+def revoke_sessions(oid=None, sid=None):
+    # Delete every Django session recorded for the given oid or sid.
+    # Only the sessions of that user are touched, the session table is never scanned.
+    # Returns the number of sessions revoked.
+    if not oid and not sid:
+        raise ValueError('An oid or sid is required to revoke sessions')
+    microsoftsessions = MicrosoftSession.objects.all()
+    if oid:
+        microsoftsessions = microsoftsessions.filter(oid=oid)
+    if sid:
+        microsoftsessions = microsoftsessions.filter(sid=sid)
+    session_keys = list(microsoftsessions.values_list('session_key', flat=True))
+
+    SessionStore = _session_store()
+    for session_key in session_keys:
+        SessionStore(session_key).delete()
+    MicrosoftSession.objects.filter(session_key__in=session_keys).delete()
+    logger.info('Revoked %s sessions for oid=%s sid=%s' % (len(session_keys), oid, sid))
+    return len(session_keys)
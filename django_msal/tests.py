@@ -1,3 +1,446 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import threading
+import time
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model, logout as auth_logout
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from . import audit, conf, graph, views
+from .admin import MicrosoftUserAdmin, SignInEventAdmin
+from .auth import MSALAuthBackend
+from .models import MicrosoftSession, MicrosoftTenant, MicrosoftUser, SignInEvent
+from .provisioning import ProvisioningError, provision_users, read_records
+from .sessions import prune_sessions, revoke_sessions
+
+User = get_user_model()
+
+
+class MicrosoftUserAdminTests(TestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.linked = User.objects.create(username='linked')
+        self.linked.microsoftuser.oid = 'oid-1'
+        self.linked.microsoftuser.preferred_username = 'linked@example.com'
+        self.linked.microsoftuser.name = 'Jane'
+        self.linked.microsoftuser.save()
+        self.unlinked = User.objects.create(username='unlinked')
+        self.model_admin = MicrosoftUserAdmin(MicrosoftUser, admin.site)
+
+    def changelist_users(self, **params):
+        request = RequestFactory().get('/admin/django_msal/microsoftuser/', params)
+        request.user = self.superuser
+        changelist = self.model_admin.get_changelist_instance(request)
+        return set(changelist.get_queryset(request).values_list('user__username', flat=True))
+
+    def test_search_matches_oid_exactly(self):
+        self.assertEqual(self.changelist_users(q='oid-1'), {'linked'})
+        self.assertEqual(self.changelist_users(q='OID-1'), set())
+
+    def test_search_matches_preferred_username_and_name_case_insensitively(self):
+        self.assertEqual(self.changelist_users(q='LINKED@example.com'), {'linked'})
+        self.assertEqual(self.changelist_users(q='JANE'), {'linked'})
+        self.assertEqual(self.changelist_users(q='linked'), set())
+
+    def test_linked_filter(self):
+        self.assertEqual(self.changelist_users(linked='yes'), {'linked'})
+        self.assertEqual(self.changelist_users(linked='no'), {'unlinked', 'admin'})
+
+    def test_paginator_counts_filtered_changelists(self):
+        paginator = self.model_admin.get_paginator(None, MicrosoftUser.objects.filter(oid__isnull=True).order_by('pk'), 100)
+        self.assertEqual(paginator.count, 2)
+
+
+class LinkMicrosoftUsersTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            User.objects.create(username='user%s' % i, email='user%s@example.com' % i)
+
+    def graph_response(self, url, headers):
+        email = url.split('/')[-1].split('?')[0]
+        response = mock.Mock()
+        response.json.return_value = {
+            'id': 'oid-%s' % email, 'userPrincipalName': email, 'displayName': email.split('@')[0],
+        }
+        return response
+
+    @mock.patch.object(graph, 'acquire_app_token', return_value='token')
+    def test_links_every_user_across_chunks(self, acquire_app_token):
+        unlinked = MicrosoftUser.objects.filter(oid=None)
+        reports = []
+        with mock.patch.object(graph.requests, 'get', side_effect=self.graph_response) as get:
+            processed = graph.link_microsoft_users(unlinked, report=reports.append, chunk_size=2)
+        # Each linked user leaves the oid=None selection, which must not make the walk skip rows
+        self.assertEqual(processed, 5)
+        self.assertEqual(get.call_count, 5)
+        self.assertFalse(MicrosoftUser.objects.filter(oid=None).exists())
+        microsoftuser = MicrosoftUser.objects.get(user__username='user3')
+        self.assertEqual(microsoftuser.oid, 'oid-user3@example.com')
+        self.assertEqual(microsoftuser.tenant.tid, conf.DJANGO_MSAL_PRIMARY_TENANT_ID)
+        self.assertFalse(microsoftuser.user.has_usable_password())
+
+    @mock.patch.object(graph, 'acquire_app_token', return_value='token')
+    def test_reports_users_without_email(self, acquire_app_token):
+        User.objects.create(username='no-email')
+        reports = []
+        with mock.patch.object(graph.requests, 'get', side_effect=self.graph_response):
+            graph.link_microsoft_users(MicrosoftUser.objects.filter(user__username='no-email'), report=reports.append)
+        self.assertEqual(len(reports), 1)
+        self.assertIn('does not have an email address', reports[0])
+
+
+class ProvisionUsersTests(TestCase):
+    def setUp(self):
+        self.tenant = MicrosoftTenant.objects.create(tid='tenant-1', name='Tenant 1')
+
+    def jsonl(self, *records):
+        return io.StringIO('\n'.join(r if isinstance(r, str) else json.dumps(r) for r in records))
+
+    def test_creates_users_and_microsoftusers_in_batches(self):
+        records = [{'oid': 'oid-%s' % i, 'preferred_username': 'user%s@example.com' % i, 'name': 'User %s' % i}
+                   for i in range(5)]
+        totals = provision_users(records, self.tenant, batch_size=2, send_emails=False)
+        self.assertEqual(totals, {'created': 5, 'skipped': 0, 'invalid': 0})
+        microsoftuser = MicrosoftUser.objects.get(oid='oid-3')
+        self.assertEqual(microsoftuser.tenant, self.tenant)
+        self.assertEqual(microsoftuser.user.username, 'user3@example.com')
+        self.assertEqual(microsoftuser.user.email, 'user3@example.com')
+        self.assertFalse(microsoftuser.user.has_usable_password())
+
+    def test_skips_already_provisioned_oids(self):
+        records = [{'oid': 'oid-1', 'preferred_username': 'user1@example.com'}]
+        provision_users(records, self.tenant, send_emails=False)
+        totals = provision_users(records + records, self.tenant, send_emails=False)
+        self.assertEqual(totals, {'created': 0, 'skipped': 2, 'invalid': 0})
+
+    def test_allocates_unique_usernames(self):
+        User.objects.create(username='taken@example.com')
+        records = [{'oid': 'oid-%s' % i, 'preferred_username': 'taken@example.com'} for i in range(2)]
+        provision_users(records, self.tenant, send_emails=False)
+        usernames = set(MicrosoftUser.objects.filter(oid__in=['oid-0', 'oid-1']).values_list('user__username', flat=True))
+        self.assertEqual(usernames, {'taken@example.com_1', 'taken@example.com_2'})
+
+    def test_rejects_unknown_tenants(self):
+        records = [
+            {'oid': 'oid-1', 'preferred_username': 'user1@example.com', 'tid': 'tenant-1'},
+            {'oid': 'oid-2', 'preferred_username': 'user2@example.com', 'tid': 'unknown'},
+        ]
+        totals = provision_users(records, self.tenant, send_emails=False)
+        self.assertEqual(totals, {'created': 1, 'skipped': 0, 'invalid': 1})
+        self.assertFalse(MicrosoftTenant.objects.filter(tid='unknown').exists())
+        self.assertFalse(MicrosoftUser.objects.filter(oid='oid-2').exists())
+
+    def test_counts_records_that_are_not_objects_as_invalid(self):
+        lines = self.jsonl({'oid': 'oid-1', 'preferred_username': 'user1@example.com'}, '[1, 2]', '{bad', '"text"',
+                           {'name': 'No oid'})
+        totals = provision_users(read_records(lines), self.tenant, send_emails=False)
+        self.assertEqual(totals, {'created': 1, 'skipped': 0, 'invalid': 4})
+
+    def test_accepts_graph_and_scim_attributes(self):
+        records = [
+            {'id': 'oid-1', 'userPrincipalName': 'graph@example.com', 'displayName': 'Graph', 'mail': 'g@example.com'},
+            {'externalId': 'oid-2', 'userName': 'scim@example.com',
+             'emails': [{'value': 'other@example.com'}, {'value': 's@example.com', 'primary': True}]},
+        ]
+        provision_users(records, self.tenant, send_emails=False)
+        self.assertEqual(User.objects.get(microsoftuser__oid='oid-1').email, 'g@example.com')
+        self.assertEqual(User.objects.get(microsoftuser__oid='oid-2').email, 's@example.com')
+
+    def test_reads_csv(self):
+        lines = io.StringIO('oid,preferred_username,name\noid-1,user1@example.com,User 1\n')
+        totals = provision_users(read_records(lines, 'csv'), self.tenant, send_emails=False)
+        self.assertEqual(totals['created'], 1)
+
+    def test_keeps_totals_of_saved_batches_on_read_errors(self):
+        def records():
+            yield {'oid': 'oid-1', 'preferred_username': 'user1@example.com'}
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+        with self.assertRaises(ProvisioningError) as cm:
+            provision_users(records(), self.tenant, batch_size=1, send_emails=False)
+        self.assertEqual(cm.exception.totals, {'created': 1, 'skipped': 0, 'invalid': 0})
+
+    def test_keeps_totals_of_saved_batches_on_integrity_errors(self):
+        records = [{'oid': 'oid-%s' % i, 'preferred_username': 'user%s@example.com' % i} for i in range(2)]
+        real_bulk_create = MicrosoftUser.objects.bulk_create
+        calls = []
+
+        def bulk_create(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise IntegrityError('UNIQUE constraint failed: django_msal_microsoftuser.oid')
+            return real_bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(MicrosoftUser.objects, 'bulk_create', side_effect=bulk_create):
+            with self.assertRaises(ProvisioningError) as cm:
+                provision_users(records, self.tenant, batch_size=1, send_emails=False)
+        self.assertEqual(cm.exception.totals, {'created': 1, 'skipped': 0, 'invalid': 0})
+        # The failed batch was rolled back, including its User rows
+        self.assertFalse(User.objects.filter(username='user1@example.com').exists())
+
+    def test_email_failures_do_not_stop_provisioning(self):
+        records = [{'oid': 'oid-%s' % i, 'preferred_username': 'user%s@example.com' % i} for i in range(2)]
+        with mock.patch('django_msal.provisioning._send_new_account_emails', side_effect=OSError('SMTP down')):
+            with self.assertLogs('django_msal.provisioning', 'ERROR'):
+                totals = provision_users(records, self.tenant, batch_size=1, send_emails=True)
+        self.assertEqual(totals['created'], 2)
+
+    def test_sends_one_admin_email_per_batch(self):
+        records = [{'oid': 'oid-%s' % i, 'preferred_username': 'user%s@example.com' % i} for i in range(3)]
+        with mock.patch.object(conf, 'DJANGO_MSAL_ADMINS', [('Admin', 'admin@example.com')], create=True), \
+                mock.patch.object(conf, 'DJANGO_MSAL_FROM_EMAIL', 'app@example.com', create=True):
+            provision_users(records, self.tenant, batch_size=10, send_emails=True)
+        admin_emails = [m for m in mail.outbox if m.to == ['admin@example.com']]
+        self.assertEqual(len(admin_emails), 1)
+        self.assertEqual(len(mail.outbox), 4)
+
+
+@mock.patch.object(conf, 'DJANGO_MSAL_PROVISIONING_TOKEN', 'secret')
+@mock.patch.object(conf, 'DJANGO_MSAL_SEND_NEW_ACCOUNT_EMAILS', False)
+class ProvisionViewTests(TestCase):
+    def post(self, body, token='secret', content_type='application/x-ndjson'):
+        request = RequestFactory().post('/provision/', body, content_type=content_type,
+                                        HTTP_AUTHORIZATION='Bearer %s' % token)
+        return views.provision(request)
+
+    def test_rejects_invalid_token(self):
+        self.assertEqual(self.post('', token='wrong').status_code, 403)
+
+    def test_rejects_non_ascii_token(self):
+        self.assertEqual(self.post('', token='s\xe9cret').status_code, 403)
+
+    def test_counts_lines_that_are_not_objects(self):
+        body = '{"oid": "oid-1", "preferred_username": "user1@example.com"}\n[1, 2]\n'
+        response = self.post(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'created': 1, 'skipped': 0, 'invalid': 1})
+
+    def test_returns_partial_totals_on_read_errors(self):
+        body = b'{"oid": "oid-1", "preferred_username": "user1@example.com"}\n\xff\n'
+        with mock.patch.object(conf, 'DJANGO_MSAL_PROVISIONING_BATCH_SIZE', 1):
+            response = self.post(body)
+        self.assertEqual(response.status_code, 400)
+        content = json.loads(response.content)
+        self.assertEqual(content['created'], 1)
+        self.assertIn('error', content)
+
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def write(self, events):
+        self.batches.append(events)
+        self.written.set()
+
+
+class FailingSink:
+    def write(self, events):
+        raise RuntimeError('sink is down')
+
+
+class AuditBufferTests(TestCase):
+    def test_drops_and_counts_events_when_full(self):
+        buffer = audit.AuditBuffer(ListSink(), max_size=2, batch_size=10, flush_interval=60)
+        for i in range(5):
+            buffer.emit({'i': i})
+        self.assertEqual(buffer.stats['emitted'], 2)
+        self.assertEqual(buffer.stats['dropped'], 3)
+        buffer.flush()
+        self.assertEqual(buffer.stats['written'], 2)
+
+    def test_flush_writes_in_batches(self):
+        sink = ListSink()
+        buffer = audit.AuditBuffer(sink, max_size=100, batch_size=10, flush_interval=60)
+        for i in range(25):
+            buffer.emit({'i': i})
+        buffer.flush()
+        self.assertEqual([len(batch) for batch in sink.batches], [10, 10, 5])
+        self.assertEqual([e['i'] for batch in sink.batches for e in batch], list(range(25)))
+        self.assertEqual(buffer.stats['written'], 25)
+
+    def test_background_thread_flushes_a_full_batch(self):
+        sink = ListSink()
+        buffer = audit.AuditBuffer(sink, max_size=100, batch_size=2, flush_interval=60)
+        buffer.emit({'i': 0})
+        buffer.emit({'i': 1})
+        self.assertTrue(sink.written.wait(5))
+        deadline = time.monotonic() + 5
+        while buffer.stats['written'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(buffer.stats['written'], 2)
+
+    def test_counts_sink_failures(self):
+        buffer = audit.AuditBuffer(FailingSink(), max_size=100, batch_size=10, flush_interval=60)
+        for i in range(3):
+            buffer.emit({'i': i})
+        with self.assertLogs('django_msal.audit', 'ERROR'):
+            buffer.flush()
+        self.assertEqual(buffer.stats['failed'], 3)
+        self.assertEqual(buffer.stats['written'], 0)
+
+    def test_database_sink_writes_sign_in_events(self):
+        audit.DatabaseSink().write([
+            {'oid': 'oid-1', 'tid': 'tenant-1', 'outcome': SignInEvent.SUCCESS, 'reason': '', 'latency_ms': 12},
+            {'oid': None, 'tid': None, 'outcome': SignInEvent.FAILURE, 'reason': 'denied', 'latency_ms': 3},
+        ])
+        self.assertEqual(SignInEvent.objects.filter(outcome=SignInEvent.FAILURE, reason='denied').count(), 1)
+        self.assertEqual(SignInEvent.objects.count(), 2)
+
+    def test_emit_does_nothing_when_disabled(self):
+        with mock.patch.object(conf, 'DJANGO_MSAL_AUDIT_ENABLED', False), \
+                mock.patch.object(audit, 'get_buffer') as get_buffer:
+            audit.emit(SignInEvent.SUCCESS)
+        get_buffer.assert_not_called()
+
+    def test_prune_deletes_old_events(self):
+        SignInEvent.objects.create(outcome=SignInEvent.SUCCESS, created=timezone.now() - datetime.timedelta(days=10))
+        SignInEvent.objects.create(outcome=SignInEvent.SUCCESS)
+        call_command('prune_ms_sign_in_events', days=5, batch_size=1, stdout=io.StringIO())
+        self.assertEqual(SignInEvent.objects.count(), 1)
+
+
+class AuthorizeAuditTests(TestCase):
+    def setUp(self):
+        self.tenant = MicrosoftTenant.objects.create(tid='tid-1', name='Tenant', is_active=True)
+        self.SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+
+    def authorize(self, token_result=None, **params):
+        request = RequestFactory().get('/authorize/', dict({'state': 'state-1', 'code': 'code-1'}, **params))
+        request.session = self.SessionStore()
+        request.session['state'] = 'state-1'
+        request.user = AnonymousUser()
+        with mock.patch.object(MSALAuthBackend, 'acquire_token_by_authorization_code', return_value=token_result), \
+                mock.patch('django_msal.views.audit.emit') as emit:
+            views.authorize(request)
+        emit.assert_called_once()
+        return emit.call_args
+
+    def test_records_request_failures_with_the_error(self):
+        args, kwargs = self.authorize(error='access_denied')
+        self.assertEqual(args, (SignInEvent.FAILURE,))
+        self.assertEqual(kwargs['reason'], 'access_denied')
+        self.assertIsNone(kwargs['oid'])
+
+    def test_records_tenant_rejections_with_oid_and_tid(self):
+        claims = {'oid': 'oid-1', 'tid': 'unknown-tid', 'preferred_username': 'user1@example.com'}
+        args, kwargs = self.authorize({'id_token_claims': claims})
+        self.assertEqual(args, (SignInEvent.FAILURE,))
+        self.assertEqual(kwargs['reason'], 'Invalid Tenant ID')
+        self.assertEqual((kwargs['oid'], kwargs['tid']), ('oid-1', 'unknown-tid'))
+
+    def test_records_user_rejections_with_tid(self):
+        args, kwargs = self.authorize({'id_token_claims': {'tid': 'tid-1'}})
+        self.assertEqual(args, (SignInEvent.FAILURE,))
+        self.assertEqual(kwargs['reason'], 'Missing Object ID')
+        self.assertEqual((kwargs['oid'], kwargs['tid']), (None, 'tid-1'))
+
+    def test_records_successful_sign_ins(self):
+        user = User.objects.create(username='user1@example.com')
+        user.microsoftuser.oid = 'oid-1'
+        user.microsoftuser.save()
+        claims = {'oid': 'oid-1', 'tid': 'tid-1', 'preferred_username': 'user1@example.com'}
+        args, kwargs = self.authorize({'id_token_claims': claims})
+        self.assertEqual(args, (SignInEvent.SUCCESS,))
+        self.assertEqual((kwargs['reason'], kwargs['oid'], kwargs['tid']), ('', 'oid-1', 'tid-1'))
+        self.assertIsInstance(kwargs['latency_ms'], int)
+
+
+class SignInEventAdminTests(TestCase):
+    def test_recent_filter(self):
+        SignInEvent.objects.create(oid='oid-new', outcome=SignInEvent.SUCCESS)
+        old = SignInEvent.objects.create(oid='oid-old', outcome=SignInEvent.SUCCESS)
+        SignInEvent.objects.filter(pk=old.pk).update(created=timezone.now() - datetime.timedelta(days=2))
+        superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        request = RequestFactory().get('/', {'recent': '24h'})
+        request.user = superuser
+        changelist = SignInEventAdmin(SignInEvent, admin.site).get_changelist_instance(request)
+        self.assertEqual([e.oid for e in changelist.queryset], ['oid-new'])
+
+
+class SessionRevocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1@example.com')
+        self.user.microsoftuser.oid = 'oid-1'
+        self.user.microsoftuser.save()
+        self.SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+
+    def sign_in(self, sid, user=None):
+        request = RequestFactory().get('/authorize/')
+        request.session = self.SessionStore()
+        request.session.save()
+        request.user = AnonymousUser()
+        MSALAuthBackend().login(request, user or self.user, {'oid': 'oid-1', 'sid': sid})
+        return request
+
+    def session_exists(self, request):
+        return self.SessionStore().exists(request.session.session_key)
+
+    def test_login_records_the_session(self):
+        request = self.sign_in('sid-1')
+        entry = MicrosoftSession.objects.get(session_key=request.session.session_key)
+        self.assertEqual((entry.oid, entry.sid), ('oid-1', 'sid-1'))
+        # The pre-login session key is cycled away and not left in the index
+        self.assertEqual(MicrosoftSession.objects.count(), 1)
+
+    def test_revoke_sessions_by_oid(self):
+        first, second = self.sign_in('sid-1'), self.sign_in('sid-2')
+        self.assertEqual(revoke_sessions(oid='oid-1'), 2)
+        self.assertFalse(self.session_exists(first))
+        self.assertFalse(self.session_exists(second))
+        self.assertFalse(MicrosoftSession.objects.exists())
+
+    def test_revoke_sessions_by_sid_only_touches_that_session(self):
+        first, second = self.sign_in('sid-1'), self.sign_in('sid-2')
+        self.assertEqual(revoke_sessions(sid='sid-1'), 1)
+        self.assertFalse(self.session_exists(first))
+        self.assertTrue(self.session_exists(second))
+
+    def test_revoke_sessions_requires_oid_or_sid(self):
+        with self.assertRaises(ValueError):
+            revoke_sessions()
+
+    def test_frontchannel_logout_revokes_the_sid(self):
+        signed_in = self.sign_in('sid-1')
+        request = RequestFactory().get('/logout/frontchannel/', {'sid': 'sid-1'})
+        request.session = self.SessionStore()
+        request.user = AnonymousUser()
+        response = views.frontchannel_logout(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.session_exists(signed_in))
+        self.assertFalse(MicrosoftSession.objects.exists())
+
+    def test_any_logout_removes_the_entry(self):
+        request = self.sign_in('sid-1')
+        auth_logout(request)
+        self.assertFalse(MicrosoftSession.objects.exists())
+
+    def test_prune_removes_entries_for_expired_and_deleted_sessions(self):
+        live, expired, deleted = self.sign_in('sid-1'), self.sign_in('sid-2'), self.sign_in('sid-3')
+        expired.session.set_expiry(-60)
+        expired.session.save()
+        deleted.session.delete()
+        self.assertEqual(prune_sessions(batch_size=1), 2)
+        self.assertEqual(list(MicrosoftSession.objects.values_list('session_key', flat=True)),
+                         [live.session.session_key])
+
+    def test_prune_keeps_old_sessions_that_are_still_live(self):
+        request = self.sign_in('sid-1')
+        MicrosoftSession.objects.update(
+            created=timezone.now() - datetime.timedelta(seconds=settings.SESSION_COOKIE_AGE + 60))
+        # The session is saved again on a later request, which pushes its expiry out
+        request.session['seen'] = True
+        request.session.save()
+        self.assertEqual(prune_sessions(), 0)
+        self.assertEqual(revoke_sessions(oid='oid-1'), 1)
+        self.assertFalse(self.session_exists(request))
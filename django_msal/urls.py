@@ -7,6 +7,7 @@ from . import conf
 urlpatterns = [
     path(conf.DJANGO_MSAL_LOGIN_PATH, views.login, name='login'),
     path(conf.DJANGO_MSAL_LOGOUT_PATH, views.logout, name='logout'),
+    path(conf.DJANGO_MSAL_FRONTCHANNEL_LOGOUT_PATH, views.frontchannel_logout, name='frontchannel_logout'),
     path(conf.DJANGO_MSAL_LANDING_PATH, views.landing, name='landing'),
     path(conf.DJANGO_MSAL_REDIRECT_PATH, views.authorize, name='authorize'),
     path('%slogin/' % conf.DJANGO_MSAL_ADMIN_PATH, views.login),
@@ -17,4 +18,8 @@ if not conf.DJANGO_MSAL_ALLOW_DJANGO_USERS:
         path('%spassword_change/' % conf.DJANGO_MSAL_ADMIN_PATH, views.password_area_removed),
         path('%spassword_change/done/' % conf.DJANGO_MSAL_ADMIN_PATH, views.password_area_removed),
         path('%sauth/user/<int:pk>/password/' % conf.DJANGO_MSAL_ADMIN_PATH, views.password_area_removed),
-    ]
\ No newline at end of file
+    ]
+if conf.DJANGO_MSAL_PROVISIONING_TOKEN:
+    urlpatterns += [
+        path(conf.DJANGO_MSAL_PROVISIONING_PATH, views.provision, name='provision'),
+    ]
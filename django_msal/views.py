@@ -1,13 +1,23 @@
+import hmac
 import logging
+import time
 import uuid
 
 from django.contrib.auth import authenticate, get_user_model, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import redirect
 from django.template.response import TemplateResponse
+from django.views.decorators.clickjacking import xframe_options_exempt
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from .auth import MSALAuthBackend
-from . import conf
+from .graph import get_primary_tenant
+from .models import SignInEvent
+from .provisioning import ProvisioningError, provision_users, read_records
+from .sessions import revoke_sessions
+from . import audit, conf
 
 User = get_user_model()
 
@@ -46,6 +56,20 @@ def logout(request):
         )
     return redirect('login')
 
+
+@xframe_options_exempt
+def frontchannel_logout(request):
+    # Microsoft calls this url, in a hidden iframe, when the user signs out of their MS account.
+    # The sid query parameter identifies the sign-in session. Set the Front-channel logout URL
+    # in the Azure portal to DJANGO_MSAL_ABSOLUTE_FRONTCHANNEL_LOGOUT_PATH and add the sid optional claim.
+    sid = request.GET.get('sid')
+    revoked = revoke_sessions(sid=sid) if sid else 0
+    # Third party cookies are often blocked in the iframe, but if we do have the session, end it too
+    if request.user.is_authenticated:
+        auth_logout(request)
+    logger.info('Front-channel logout for sid %s revoked %s sessions' % (sid, revoked))
+    return HttpResponse()
+
 def _is_microsoftuser(username, is_active=True):
     try:
         user = User.objects.get(username=username, is_active=is_active)
@@ -122,6 +146,19 @@ def login(request):
     else:
         return TemplateResponse(request, 'django_msal/login.html', context=context)
 
+def _audit_sign_in(request, started, token_claims=None):
+    # The outcome is taken from the auth_error session variable set by the MSALAuthBackend validators
+    token_claims = token_claims or {}
+    auth_error = request.session.get('auth_error')
+    audit.emit(
+        SignInEvent.FAILURE if auth_error else SignInEvent.SUCCESS,
+        reason=auth_error['error'] if auth_error else '',
+        oid=token_claims.get('oid'),
+        tid=token_claims.get('tid'),
+        latency_ms=int((time.monotonic() - started) * 1000),
+    )
+
+
 def authorize(request):
     # The auth_error session variable is used to pass error information back to login page if an error occurs
     # It should not be set at this point as it is deleted in login view, but lets make sure
@@ -131,13 +168,16 @@ def authorize(request):
         pass
 
     auth_backend = MSALAuthBackend()
+    started = time.monotonic()
 
     if not auth_backend.validate_request(request):
+        _audit_sign_in(request, started)
         return redirect('login')
 
     # validate request makes sure there is a code in request GET vars
     token_result = auth_backend.acquire_token_by_authorization_code(request)
     if not auth_backend.validate_token_result(request, token_result):
+        _audit_sign_in(request, started)
         return redirect('login')
 
     # validate token claims for tenant and user
@@ -145,14 +185,41 @@ def authorize(request):
 
     tenant = auth_backend.validate_token_claims_tenant(request, token_claims)
     if not tenant:
+        _audit_sign_in(request, started, token_claims)
         return redirect('login')
 
     user = auth_backend.validate_token_claims_user(request, token_claims)
     if not user:
+        _audit_sign_in(request, started, token_claims)
         return redirect('login')
 
     # Log user in
-    auth_backend.login(request, user)
+    auth_backend.login(request, user, token_claims)
+    _audit_sign_in(request, started, token_claims)
 
     next_url = request.session.get('next_url', '/%s' % conf.DJANGO_MSAL_LANDING_PATH)
     return redirect(next_url)
+
+
+@csrf_exempt
+@require_POST
+def provision(request):
+    # Bulk provisioning of users from a CSV or JSONL body, for use by directory sync jobs.
+    # Only routed when DJANGO_MSAL_PROVISIONING_TOKEN is set.
+    # Compare bytes, as compare_digest refuses str with non-ASCII characters
+    expected = ('Bearer %s' % conf.DJANGO_MSAL_PROVISIONING_TOKEN).encode()
+    authorization = request.META.get('HTTP_AUTHORIZATION', '').encode()
+    if not hmac.compare_digest(authorization, expected):
+        logger.warn('Rejected django_msal provisioning request with an invalid token')
+        return HttpResponseForbidden()
+
+    format = 'csv' if request.content_type == 'text/csv' else 'jsonl'
+    # Iterating the request reads the body a line at a time rather than loading it all
+    lines = (line.decode(request.encoding or 'utf-8') for line in request)
+    try:
+        totals = provision_users(read_records(lines, format), get_primary_tenant(),
+                                 conf.DJANGO_MSAL_PROVISIONING_BATCH_SIZE)
+    except ProvisioningError as e:
+        # Batches before the error were saved, so report them along with the error
+        return JsonResponse(dict(e.totals, error=str(e)), status=400)
+    return JsonResponse(totals)
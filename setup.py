@@ -26,7 +26,7 @@ setuptools.setup(
     long_description_content_type='text/markdown',
     url='https://github.com/dai-ictgeo/django_msal',
     keywords='django auth msal microsoft azure',
-    install_requires=['Django >= 2.2',
+    install_requires=['Django >= 3.2',
                       'msal >= 1.4.3'
                     ],
     python_requires=">=3.6",